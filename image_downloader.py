@@ -4,31 +4,56 @@ Image Downloader - Lädt alle Bilder von einer Webseite herunter
 Verwendung: python image_downloader.py https://example.com
 """
 
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+from collections import Counter
+import aiofiles
+import httpx
+from bs4 import BeautifulSoup, Tag
 from urllib.parse import urljoin, urlparse
 import os
+import re
 import sys
 import argparse
-import hashlib
 import logging
 from datetime import datetime
+from enum import Enum
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
+import xxhash
 import mimetypes
 
+# Blockgröße beim Streamen der Bilder
+_CHUNK_SIZE = 64 * 1024
+
+# Nach so vielen fehlgeschlagenen HEAD-Requests wird der ETag-Check für einen Host übersprungen
+_HEAD_FAILURE_LIMIT = 3
+
+# Einmalig vorbereitete Muster für URL-Extraktion und Dateinamen
+_SAFE_NAME_RE = re.compile(r'[^\w.-]+')
+_BG_URL_RE = re.compile(r'url\(["\']?(.*?)["\']?\)')
+_SRCSET_RE = re.compile(r'([^\s,]+)(?:\s+[^,]*)?')
+_ABSOLUTE_URL_PREFIXES = ('http://', 'https://', 'data:')
+_IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico')
+
+
+class DownloadStatus(Enum):
+    """Ergebnis eines einzelnen Bild-Downloads"""
+    SUCCESS = 'success'
+    DUPLICATE = 'duplicate'
+    FAILED = 'failed'
+
 
 class ImageDownloader:
     def __init__(self, url, output_dir='downloaded_images', max_workers=5):
         self.url = url
         self.output_dir = output_dir
         self.max_workers = max_workers
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        self.downloaded_hashes = set()
+        }
+        self.downloaded_hashes = set()  # 64-bit xxh3-Fingerprints (int)
+        self.seen_etags = {}  # (Host, Content-Length, ETag) -> Hash bereits geladener Bilder
+        self.head_failures = Counter()  # HEAD-Requests ohne verwertbaren ETag pro Host
 
         # Logging einrichten
         self.setup_logging()
@@ -60,15 +85,18 @@ class ImageDownloader:
         domain = urlparse(self.url).netloc.replace('www.', '')
         self.output_path = os.path.join(self.output_dir, domain)
         os.makedirs(self.output_path, exist_ok=True)
+        # Bereits vergebene Dateinamen - einmal einlesen statt pro Bild stat() aufzurufen
+        # (klein geschrieben, da Windows/macOS Groß-/Kleinschreibung ignorieren)
+        self.taken_filenames = {name.lower() for name in os.listdir(self.output_path)}
         self.logger.info(f"Ausgabeordner erstellt: {self.output_path}")
 
     def get_page_content(self):
         """Lädt den HTML-Inhalt der Seite"""
         try:
-            response = self.session.get(self.url, timeout=30)
+            response = httpx.get(self.url, headers=self.headers, timeout=30, follow_redirects=True)
             response.raise_for_status()
             return response.content
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             error_msg = f"Fehler beim Abrufen der Seite: {e}"
             print(f"❌ {error_msg}")
             self.logger.error(error_msg)
@@ -78,52 +106,50 @@ class ImageDownloader:
         """Extrahiert alle Bild-URLs aus der Seite"""
         image_urls = set()
 
-        # Standard img tags
-        for img in soup.find_all('img'):
-            src = img.get('src') or img.get('data-src') or img.get('data-lazy-src')
-            if src:
-                image_urls.add(src)
-
-            # srcset für responsive Bilder
-            srcset = img.get('srcset') or img.get('data-srcset')
-            if srcset:
-                for src in srcset.split(','):
-                    url = src.strip().split(' ')[0]
-                    if url:
-                        image_urls.add(url)
-
-        # Picture elements
-        for picture in soup.find_all('picture'):
-            for source in picture.find_all('source'):
-                srcset = source.get('srcset')
+        # Ein einziger Durchlauf über den DOM statt je einem find_all pro Elementtyp
+        for element in soup.descendants:
+            if not isinstance(element, Tag):
+                continue
+
+            name = element.name
+            if name == 'img':
+                # Standard img tags
+                src = element.get('src') or element.get('data-src') or element.get('data-lazy-src')
+                if src:
+                    image_urls.add(src)
+
+                # srcset für responsive Bilder
+                srcset = element.get('srcset') or element.get('data-srcset')
+                if srcset:
+                    image_urls.update(m.group(1) for m in _SRCSET_RE.finditer(srcset))
+
+            elif name == 'source' and element.find_parent('picture') is not None:
+                # Picture elements
+                srcset = element.get('srcset')
                 if srcset:
-                    url = srcset.split(',')[0].strip().split(' ')[0]
-                    image_urls.add(url)
-
-        # CSS Background Images (inline styles)
-        for element in soup.find_all(style=True):
-            style = element.get('style', '')
-            if 'background-image' in style:
-                import re
-                urls = re.findall(r'url\(["\']?(.*?)["\']?\)', style)
+                    image_urls.update(m.group(1) for m in _SRCSET_RE.finditer(srcset))
+
+            # CSS Background Images (inline styles)
+            style = element.get('style')
+            if style and 'background-image' in style:
+                urls = _BG_URL_RE.findall(style)
                 image_urls.update(urls)
 
-        # Konvertiere relative zu absoluten URLs
-        absolute_urls = []
-        for url in image_urls:
-            absolute_url = urljoin(self.url, url)
-            if self.is_valid_image_url(absolute_url):
-                absolute_urls.append(absolute_url)
+        # Konvertiere relative zu absoluten URLs - erst deduplizieren, dann validieren.
+        # Absolute URLs (der Normalfall) brauchen kein urljoin
+        resolved_urls = {
+            url if url.startswith(_ABSOLUTE_URL_PREFIXES) else urljoin(self.url, url)
+            for url in image_urls
+        }
 
-        return list(set(absolute_urls))
+        return [url for url in resolved_urls if self.is_valid_image_url(url)]
 
     def is_valid_image_url(self, url):
         """Prüft ob die URL wahrscheinlich ein Bild ist"""
         # Prüfe Dateiendung
         path = urlparse(url).path.lower()
-        image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico']
 
-        if any(path.endswith(ext) for ext in image_extensions):
+        if path.endswith(_IMAGE_EXTS):
             return True
 
         # Prüfe auf data URLs
@@ -132,11 +158,7 @@ class ImageDownloader:
 
         return False
 
-    def get_file_hash(self, content):
-        """Berechnet den Hash des Bildinhalts zur Duplikat-Erkennung"""
-        return hashlib.md5(content).hexdigest()
-
-    def generate_filename(self, url, content, index):
+    def generate_filename(self, url, index):
         """Generiert einen sinnvollen Dateinamen"""
         # Versuche Original-Dateinamen zu extrahieren
         parsed = urlparse(url)
@@ -152,7 +174,7 @@ class ImageDownloader:
             original_name = f"image_{index}{ext}"
 
         # Entferne ungültige Zeichen
-        safe_name = "".join(c for c in original_name if c.isalnum() or c in '.-_')
+        safe_name = _SAFE_NAME_RE.sub('', original_name)
 
         # Stelle sicher, dass der Name nicht zu lang ist
         if len(safe_name) > 100:
@@ -161,64 +183,136 @@ class ImageDownloader:
 
         return safe_name
 
-    def download_image(self, url, index):
-        """Lädt ein einzelnes Bild herunter"""
+    async def download_image(self, client, url, index, sem):
+        """Lädt ein einzelnes Bild herunter - liefert (DownloadStatus, Meldung)"""
+        tmp_path = os.path.join(self.output_path, f".image_{index}.part")
         try:
-            response = self.session.get(url, timeout=30, stream=True)
-            response.raise_for_status()
-
-            content = response.content
-
-            # Prüfe auf Duplikate
-            file_hash = self.get_file_hash(content)
-            if file_hash in self.downloaded_hashes:
-                return f"Duplikat übersprungen: {url}"
-
-            self.downloaded_hashes.add(file_hash)
-
-            # Generiere Dateinamen
-            filename = self.generate_filename(url, content, index)
-            filepath = os.path.join(self.output_path, filename)
+            # Hashen und Schreiben in einem Durchlauf über die Chunks,
+            # statt das ganze Bild im Speicher zu puffern
+            hasher = xxhash.xxh3_64()
+            file_size = 0
+            async with sem:
+                # Günstiger HEAD-Request vorab: gleicher Host, ETag und gleiche Größe wie
+                # ein bereits geladenes Bild -> GET sparen. Solange noch kein ETag bekannt
+                # ist, kann es keinen Treffer geben - dann kein zusätzlicher Roundtrip
+                host = urlparse(url).netloc
+                if self.seen_etags and self.head_failures[host] < _HEAD_FAILURE_LIMIT:
+                    etag_key = await self.probe_etag(client, url, host)
+                    if etag_key in self.seen_etags:
+                        return DownloadStatus.DUPLICATE, f"Duplikat (ETag) übersprungen: {url}"
+
+                async with client.stream('GET', url) as response:
+                    response.raise_for_status()
+                    etag_key = self.get_etag_key(host, response.headers)
+                    async with aiofiles.open(tmp_path, 'wb') as f:
+                        async for chunk in response.aiter_bytes(_CHUNK_SIZE):
+                            hasher.update(chunk)
+                            await f.write(chunk)
+                            file_size += len(chunk)
+
+            # Hash und Dateiname werden außerhalb des kritischen Abschnitts berechnet
+            file_hash = hasher.intdigest()
+            filename = self.generate_filename(url, index)
+
+            return self.finalize_download(url, tmp_path, file_hash, filename, file_size, etag_key)
+
+        except httpx.HTTPError as e:
+            self.remove_partial_file(tmp_path)
+            return DownloadStatus.FAILED, f"Fehler bei {url}: {str(e)}"
+        except Exception as e:
+            self.remove_partial_file(tmp_path)
+            return DownloadStatus.FAILED, f"Unerwarteter Fehler bei {url}: {str(e)}"
 
-            # Stelle sicher, dass der Dateiname eindeutig ist
-            counter = 1
-            base, ext = os.path.splitext(filepath)
-            while os.path.exists(filepath):
-                filepath = f"{base}_{counter}{ext}"
-                counter += 1
+    def finalize_download(self, url, tmp_path, file_hash, filename, file_size, etag_key=None):
+        """Prüft auf Duplikate, vergibt einen eindeutigen Namen und verschiebt die Datei.
 
-            # Speichere das Bild
-            with open(filepath, 'wb') as f:
-                f.write(content)
+        Enthält bewusst kein await: in der Event-Loop läuft dieser Abschnitt damit
+        atomar, kein anderer Download kann denselben Hash oder Namen beanspruchen.
+        Hash, Dateiname und ETag-Schlüssel werden nur hier und erst dann vermerkt,
+        wenn das Bild tatsächlich auf der Platte liegt.
+        """
+        # Prüfe auf Duplikate
+        if file_hash in self.downloaded_hashes:
+            os.unlink(tmp_path)
+            self.remember_etag(etag_key, file_hash)
+            return DownloadStatus.DUPLICATE, f"Duplikat übersprungen: {url}"
+
+        # Stelle sicher, dass der Dateiname eindeutig ist
+        name = filename
+        counter = 1
+        base, ext = os.path.splitext(filename)
+        while name.lower() in self.taken_filenames:
+            name = f"{base}_{counter}{ext}"
+            counter += 1
+
+        os.rename(tmp_path, os.path.join(self.output_path, name))
+
+        self.downloaded_hashes.add(file_hash)
+        self.taken_filenames.add(name.lower())
+        self.remember_etag(etag_key, file_hash)
+
+        return DownloadStatus.SUCCESS, f"Erfolgreich: {filename} ({file_size / 1024:.1f} KB)"
+
+    def remember_etag(self, etag_key, file_hash):
+        """Merkt sich den ETag-Schlüssel eines Bildes, das bereits auf der Platte liegt"""
+        if etag_key is not None:
+            self.seen_etags[etag_key] = file_hash
+
+    def get_etag_key(self, host, headers):
+        """Bildet den Schlüssel (Host, Content-Length, ETag) - None ohne starken ETag"""
+        # Schwache ETags (W/...) garantieren keinen identischen Inhalt
+        etag = headers.get('etag')
+        if not etag or etag.startswith('W/'):
+            return None
+        return (host, headers.get('content-length', ''), etag)
+
+    async def probe_etag(self, client, url, host):
+        """Fragt per HEAD den ETag-Schlüssel eines Bildes ab, ohne es herunterzuladen"""
+        try:
+            response = await client.head(url)
+            response.raise_for_status()
+        except httpx.HTTPError:
+            self.head_failures[host] += 1
+            return None
 
-            file_size = len(content) / 1024  # KB
-            return f"Erfolgreich: {filename} ({file_size:.1f} KB)"
+        etag_key = self.get_etag_key(host, response.headers)
+        if etag_key is None:
+            self.head_failures[host] += 1
+        return etag_key
 
-        except requests.RequestException as e:
-            return f"Fehler bei {url}: {str(e)}"
-        except Exception as e:
-            return f"Unerwarteter Fehler bei {url}: {str(e)}"
+    def remove_partial_file(self, path):
+        """Entfernt eine unvollständige Download-Datei, falls vorhanden"""
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
 
-    def download_all_images(self, image_urls):
-        """Lädt alle Bilder parallel herunter"""
+    async def download_all_images(self, image_urls):
+        """Lädt alle Bilder parallel in einer Event-Loop herunter"""
         # Info vor Progress Bar ausgeben
         print(f"\n📥 Starte Download von {len(image_urls)} Bildern...\n")
         self.logger.info(f"Starte Download von {len(image_urls)} Bildern...")
 
         results = []
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+        sem = asyncio.Semaphore(self.max_workers)
+        limits = httpx.Limits(max_connections=self.max_workers,
+                              max_keepalive_connections=self.max_workers)
+
+        # HTTP/2 bündelt viele Bild-Requests an denselben Host über eine Verbindung
+        async with httpx.AsyncClient(http2=True, limits=limits, headers=self.headers,
+                                     timeout=30.0, follow_redirects=True) as client:
             # Erstelle Tasks
-            future_to_url = {
-                executor.submit(self.download_image, url, i): (url, i)
+            tasks = [
+                asyncio.create_task(self.download_image(client, url, i, sem))
                 for i, url in enumerate(image_urls)
-            }
+            ]
 
             # Progress Bar
             with tqdm(total=len(image_urls), desc="Downloading", ncols=100) as pbar:
-                for future in as_completed(future_to_url):
-                    result = future.result()
-                    results.append(result)
-                    self.logger.info(result)  # Nur in Log-Datei
+                for task in asyncio.as_completed(tasks):
+                    status, message = await task
+                    results.append((status, message))
+                    self.logger.info(message)  # Nur in Log-Datei
                     pbar.update(1)
 
         # Nach Progress Bar eine Leerzeile
@@ -228,9 +322,11 @@ class ImageDownloader:
 
     def generate_report(self, results):
         """Erstellt einen Abschlussbericht"""
-        successful = sum(1 for r in results if r.startswith("Erfolgreich"))
-        duplicates = sum(1 for r in results if "Duplikat" in r)
-        failed = sum(1 for r in results if "Fehler" in r)
+        # Ein Durchlauf über die Ergebnisse, gezählt nach Status statt nach Text
+        counts = Counter(status for status, _ in results)
+        successful = counts[DownloadStatus.SUCCESS]
+        duplicates = counts[DownloadStatus.DUPLICATE]
+        failed = counts[DownloadStatus.FAILED]
 
         # Report erstellen
         report_lines = [
@@ -258,8 +354,8 @@ class ImageDownloader:
             f.write(f"URL: {self.url}\n")
             f.write(report_text)
             f.write("\n\nDetaillierte Ergebnisse:\n")
-            for result in results:
-                f.write(f"{result}\n")
+            for _, message in results:
+                f.write(f"{message}\n")
 
         print(f"\n📄 Detaillierter Bericht gespeichert: {report_file}")
 
@@ -277,8 +373,8 @@ class ImageDownloader:
         self.logger.info("Lade Webseite...")
         content = self.get_page_content()
 
-        # Parse HTML
-        soup = BeautifulSoup(content, 'html.parser')
+        # Parse HTML (lxml ist als C-Parser deutlich schneller als html.parser)
+        soup = BeautifulSoup(content, 'lxml')
 
         # Extrahiere Bild-URLs
         print("🔍 Extrahiere Bild-URLs...")
@@ -294,7 +390,7 @@ class ImageDownloader:
         self.logger.info(f"{len(image_urls)} Bilder gefunden")
 
         # Lade Bilder herunter
-        results = self.download_all_images(image_urls)
+        results = asyncio.run(self.download_all_images(image_urls))
 
         # Erstelle Bericht
         self.generate_report(results)
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import httpx
+
+import image_downloader
+from image_downloader import DownloadStatus, ImageDownloader
+
+
+class EtagDedupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.old_cwd = os.getcwd()
+        # setup_logging legt die Log-Datei im aktuellen Verzeichnis an
+        os.chdir(self.tmp_dir.name)
+
+        self.downloader = ImageDownloader('https://example.com', output_dir='out')
+        self.downloader.create_output_directory()
+
+    def tearDown(self):
+        for handler in self.downloader.logger.handlers:
+            handler.close()
+        os.chdir(self.old_cwd)
+        self.tmp_dir.cleanup()
+
+    def download(self, urls, bodies=None, etag='"same"'):
+        """Lädt die URLs nacheinander über einen Mock-Server mit identischem ETag"""
+        bodies = bodies or {}
+        self.requests = []
+
+        def handler(request):
+            self.requests.append((request.method, str(request.url)))
+            content = bodies.get(str(request.url), b'image')
+            headers = {'ETag': etag, 'Content-Length': str(len(content))}
+            if request.method == 'HEAD':
+                content = b''
+            return httpx.Response(200, headers=headers, content=content)
+
+        async def run():
+            sem = asyncio.Semaphore(1)
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                return [await self.downloader.download_image(client, url, i, sem)
+                        for i, url in enumerate(urls)]
+
+        return asyncio.run(run())
+
+    def test_failed_rename_does_not_register_etag(self):
+        real_rename = os.rename
+        calls = []
+
+        def flaky_rename(src, dst):
+            calls.append(dst)
+            if len(calls) == 1:
+                raise OSError('disk full')
+            real_rename(src, dst)
+
+        with mock.patch.object(image_downloader.os, 'rename', side_effect=flaky_rename):
+            results = self.download(['https://example.com/etag1.png',
+                                     'https://example.com/etag2.png'])
+
+        statuses = [status for status, _ in results]
+        self.assertEqual(statuses, [DownloadStatus.FAILED, DownloadStatus.SUCCESS])
+        self.assertEqual(os.listdir(self.downloader.output_path), ['etag2.png'])
+
+    def test_same_etag_is_skipped_after_successful_download(self):
+        results = self.download(['https://example.com/etag1.png',
+                                 'https://example.com/etag2.png'])
+
+        statuses = [status for status, _ in results]
+        self.assertEqual(statuses, [DownloadStatus.SUCCESS, DownloadStatus.DUPLICATE])
+        self.assertEqual(os.listdir(self.downloader.output_path), ['etag1.png'])
+
+    def test_same_etag_on_different_hosts_is_downloaded(self):
+        first = 'https://a.example.com/first.png'
+        second = 'https://b.example.com/second.png'
+        results = self.download([first, second], bodies={first: b'image', second: b'photo'})
+
+        statuses = [status for status, _ in results]
+        self.assertEqual(statuses, [DownloadStatus.SUCCESS, DownloadStatus.SUCCESS])
+        self.assertEqual(sorted(os.listdir(self.downloader.output_path)),
+                         ['first.png', 'second.png'])
+
+    def test_weak_etag_is_not_used_as_key(self):
+        first = 'https://example.com/first.png'
+        second = 'https://example.com/second.png'
+        results = self.download([first, second], bodies={first: b'image', second: b'photo'},
+                                etag='W/"same"')
+
+        statuses = [status for status, _ in results]
+        self.assertEqual(statuses, [DownloadStatus.SUCCESS, DownloadStatus.SUCCESS])
+        self.assertEqual(self.downloader.seen_etags, {})
+
+    def test_no_head_request_while_no_etag_is_known(self):
+        self.download(['https://example.com/etag1.png'])
+
+        self.assertEqual(self.requests, [('GET', 'https://example.com/etag1.png')])
+
+
+if __name__ == '__main__':
+    unittest.main()